@@ -0,0 +1,142 @@
+"""
+Export the MEPS v2 regressors to ONNX for the utilization service.
+
+Only the final HistGradientBoostingRegressor of each saved pipeline is
+converted: the preprocessing stages include a custom `neg_to_nan`
+FunctionTransformer that skl2onnx cannot translate, and the server already
+runs them once per batch in sklearn. skl2onnx emits the raw (log-scale) score
+for the Poisson regressors, so an `Exp` node is appended to apply the inverse
+link. Each export is checked against sklearn on a synthetic batch of
+realistic inputs and nothing is written if any target disagrees. The
+joblib hashes of the source preprocessor and regressor are stored in the model
+metadata so the server can detect exports that no longer match the pickles.
+
+Usage (from the repository root):
+    pip install -r python-models/requirements-onnx.txt
+    python python-models/models/export_onnx.py
+"""
+
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import onnxruntime as ort
+from onnx import helper
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn._loss.link import LogLink
+
+PYTHON_MODELS_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PYTHON_MODELS_DIR))
+
+# `neg_to_nan` is imported so the pickles, which reference it as
+# `__main__.neg_to_nan`, can be unpickled when this file runs as a script.
+from server.server import (  # noqa: E402,F401
+    COUNT_TARGETS,
+    FEATURE_COLS,
+    _load_models,
+    _split_pipelines,
+    neg_to_nan,
+)
+
+ONNX_DIR = PYTHON_MODELS_DIR / "models" / "v2-onnx"
+
+# Ranges of the passthrough (non one-hot) features, roughly matching the MEPS
+# 2022 training data: (low, high, decimals)
+CONTINUOUS_RANGES = {
+    "age_years_2022": (0, 85, 0),
+    "education_years": (0, 17, 0),
+    "family_income_2022": (0, 500_000, 0),
+    "poverty_level_pct": (0, 2400, 2),
+    "hours_worked_per_week": (0, 99, 0),
+    "family_size": (1, 13, 0),
+    "snap_benefit_value_2022": (0, 8600, 0),
+    "bmi": (15, 50, 1),
+    "exercise_days_per_week": (0, 7, 0),
+    "years_in_us": (1, 5, 0),
+    "cognitive_limitation": (1, 2, 0),
+    "hopelessness_frequency_30d": (0, 4, 0),
+    "sadness_frequency_30d": (0, 4, 0),
+}
+
+
+def _sample_batch(preprocessor, n_rows: int = 2000, seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic rows with categorical codes drawn from the fitted one-hot
+    categories and continuous values from CONTINUOUS_RANGES. About 10% of
+    values are missing, limited to columns that had missing values in training.
+    """
+    rng = np.random.default_rng(seed)
+    column_transformer = preprocessor.named_steps["preproc"]
+    encoder = column_transformer.named_transformers_["cat"].named_steps["onehot"]
+    cat_cols = column_transformer.transformers_[0][2]
+
+    X = np.empty((n_rows, len(FEATURE_COLS)))
+    missing = np.zeros(len(FEATURE_COLS), dtype=bool)
+    for col, categories in zip(cat_cols, encoder.categories_):
+        idx = FEATURE_COLS.index(col)
+        codes = np.asarray(categories, dtype=np.float64)
+        X[:, idx] = rng.choice(codes[~np.isnan(codes)], n_rows)
+        missing[idx] = np.isnan(codes).any()
+    for col, (low, high, decimals) in CONTINUOUS_RANGES.items():
+        idx = FEATURE_COLS.index(col)
+        X[:, idx] = np.round(rng.uniform(low, high, n_rows), decimals)
+        missing[idx] = True
+    X[(rng.random(X.shape) < 0.1) & missing] = np.nan
+    return pd.DataFrame(X, columns=FEATURE_COLS)
+
+
+def _append_exp(onx) -> None:
+    """Apply the inverse log link to the graph output (raw score -> mean)."""
+    output = onx.graph.output[0].name
+    raw = f"{output}_raw"
+    for node in onx.graph.node:
+        for i, name in enumerate(node.output):
+            if name == output:
+                node.output[i] = raw
+    onx.graph.node.append(helper.make_node("Exp", [raw], [output]))
+
+
+def main() -> None:
+    preprocessors, estimators = _split_pipelines(_load_models())
+    frame = _sample_batch(next(iter(preprocessors.values())))
+    transformed = {key: pre.transform(frame) for key, pre in preprocessors.items()}
+
+    exports = {}
+    for target in COUNT_TARGETS:
+        key, est = estimators[target]
+        onx = convert_sklearn(
+            est,
+            initial_types=[("X", FloatTensorType([None, est.n_features_in_]))],
+        )
+        if isinstance(est._loss.link, LogLink):
+            _append_exp(onx)
+        # The server only uses an export whose hashes match the pipeline it loads
+        helper.set_model_props(
+            onx, {"preprocessor_hash": key, "estimator_hash": joblib.hash(est)}
+        )
+        payload = onx.SerializeToString()
+
+        Xt = transformed[key]
+        session = ort.InferenceSession(payload, providers=["CPUExecutionProvider"])
+        got = session.run(None, {"X": Xt.astype(np.float32)})[0].ravel()
+        expected = est.predict(Xt)
+        if not np.allclose(got, expected, rtol=1e-3, atol=1e-3):
+            max_diff = float(np.max(np.abs(got - expected)))
+            raise SystemExit(
+                f"ONNX export for '{target}' disagrees with sklearn "
+                f"(max abs diff {max_diff:.4g}); nothing written"
+            )
+        exports[target] = payload
+        print(f"Verified ONNX export for {target}")
+
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    for target, payload in exports.items():
+        (ONNX_DIR / f"model_{target}.onnx").write_bytes(payload)
+    print(f"Wrote {len(exports)} models to {ONNX_DIR}")
+
+
+if __name__ == "__main__":
+    main()
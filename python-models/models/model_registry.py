@@ -2,19 +2,44 @@
 MLflow model management and registry.
 """
 
+from collections import OrderedDict
+
 import mlflow
 import mlflow.sklearn
 
 from mlflow.exceptions import MlflowException
 
+# Number of loaded models kept per manager; older entries are evicted first
+MODEL_CACHE_SIZE = 4
+
 
 class ModelRegistryManager:
     """
     Class to manage the registration, versioning, and retrieval of models
     using MLflow.
+
+    The MLflow client is created on first use from the current tracking and
+    registry URIs, so `mlflow.set_tracking_uri()` after construction is
+    respected.
     """
     def __init__(self, model_name: str):
         self.model_name = model_name
+        self._client = None
+        self._client_uris = None
+        # Loaded models keyed by (stage, version) so repeated fetches reuse them
+        self._model_cache = OrderedDict()
+
+    def _get_client(self):
+        """
+        Return an MlflowClient for the current URIs, creating it on first use
+        and again whenever the URIs change (which also clears the model cache).
+        """
+        uris = (mlflow.get_tracking_uri(), mlflow.get_registry_uri())
+        if self._client is None or uris != self._client_uris:
+            self._client = mlflow.tracking.MlflowClient(*uris)
+            self._client_uris = uris
+            self._model_cache.clear()
+        return self._client
 
     def register_model(self, run_id: str):
         """
@@ -37,8 +62,7 @@ class ModelRegistryManager:
         Transition a model version to a different stage.
         """
         try:
-            client = mlflow.tracking.MlflowClient()
-            client.transition_model_version_stage(
+            self._get_client().transition_model_version_stage(
                 self.model_name,
                 version,
                 stage
@@ -52,16 +76,24 @@ class ModelRegistryManager:
         Fetch the latest model for a given stage.
         """
         try:
-            client = mlflow.tracking.MlflowClient()
-            model_versions = client.search_model_versions(f"name='{self.model_name}'")
+            client = self._get_client()
+            model_versions = client.get_latest_versions(self.model_name, stages=[stage])
+            if not model_versions:
+                print(f"No model found at stage: {stage}")
+                return None
 
-            for version in model_versions:
-                if version.current_stage == stage:
-                    print(f"Fetching latest model at stage: {stage}")
-                    return mlflow.sklearn.load_model(f"models:/{self.model_name}/{version.version}")
+            version = model_versions[0].version
+            key = (stage, version)
+            if key in self._model_cache:
+                self._model_cache.move_to_end(key)
+                return self._model_cache[key]
 
-            print(f"No model found at stage: {stage}")
-            return None
+            print(f"Fetching latest model at stage: {stage}")
+            model = mlflow.sklearn.load_model(f"models:/{self.model_name}/{version}")
+            self._model_cache[key] = model
+            if len(self._model_cache) > MODEL_CACHE_SIZE:
+                self._model_cache.popitem(last=False)
+            return model
 
         except MlflowException as e:
             print(f"Error fetching model at stage '{stage}': {str(e)}")
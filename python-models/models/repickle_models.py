@@ -0,0 +1,58 @@
+"""
+Re-dump the MEPS v2 pipelines with pickle protocol 5 and no compression.
+
+Uncompressed joblib files can be memory-mapped by the utilization service,
+and protocol 5 restores any large buffers not handled by joblib's own array
+wrapper without an extra copy. Each re-dumped file is loaded back and must
+predict identically on a synthetic batch before it replaces the original.
+
+Usage (from the repository root):
+    python python-models/models/repickle_models.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+PYTHON_MODELS_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PYTHON_MODELS_DIR))
+
+from server.server import COUNT_TARGETS, FEATURE_COLS, neg_to_nan  # noqa: E402
+
+# The pickles reference the helper as `__main__.neg_to_nan`: expose it there for
+# loading, and keep that qualified name when re-dumping so the server (which
+# registers the same shim) can still unpickle the files.
+neg_to_nan.__module__ = "__main__"
+
+MODELS_DIR = PYTHON_MODELS_DIR / "models" / "v2-pkl"
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 10, size=(64, len(FEATURE_COLS))).astype(np.float64)
+    X[rng.random(X.shape) < 0.2] = np.nan
+    frame = pd.DataFrame(X, columns=FEATURE_COLS)
+
+    for target in COUNT_TARGETS:
+        model_path = MODELS_DIR / f"model_{target}.pkl"
+        tmp_path = model_path.with_suffix(".pkl.tmp")
+
+        model = joblib.load(str(model_path))
+        joblib.dump(model, str(tmp_path), compress=0, protocol=5)
+
+        reloaded = joblib.load(str(tmp_path), mmap_mode="r")
+        if not np.array_equal(model.predict(frame), reloaded.predict(frame)):
+            tmp_path.unlink()
+            raise SystemExit(f"Re-dumped '{target}' predicts differently; left unchanged")
+        del reloaded
+
+        os.replace(tmp_path, model_path)
+        print(f"Re-dumped {model_path.name} with protocol 5")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,78 @@
 """
 MEPS v2 Utilization Service (FastAPI)
 
-Exposes two endpoints used by the Next.js app:
-- GET /health: Verifies model registry can be loaded from `python-models/models/v2-pkl`.
+Exposes the endpoints used by the Next.js app:
+- GET /health: Liveness check; returns 503 if the inference worker pool (whose
+  workers load the models from `python-models/models/v2-pkl` at startup) is
+  broken or has lost a worker, without queueing any work behind predictions.
 - POST /predict: Accepts optional numeric features, assembles them in the
   expected column order, and runs saved joblib pipelines to produce annual
   utilization count predictions for multiple targets (pcp visits, outpatient,
   ER, inpatient admits, home health, Rx fills, dental, equipment).
+- POST /predict_batch: Same as /predict for a list of up to 1000 rows
+  (`{"rows": [...]}`), scored in a single pass and returned in request order.
 
 Implementation details:
-- Lazy-loads all target-specific pipelines on first request.
+- Runs inference in a process pool whose workers each load and warm all
+  target-specific pipelines at startup, keeping CPU-bound sklearn work off the
+  event loop and out from under a single GIL. Workers are spawned (not forked
+  from the server process), and the pool is rebuilt if a worker dies.
+- Micro-batches concurrent `/predict` calls: requests arriving within
+  `MAX_WAIT_MS` of each other are stacked into one DataFrame so each pipeline
+  runs `predict` once per batch rather than once per request.
 - Includes a shim for pickled preprocessing helpers (e.g., `neg_to_nan`) that
   may have been saved under `__mp_main__` during training.
+- Splits each pipeline into its preprocessing stages and final regressor;
+  identical preprocessors are deduplicated so a batch is transformed once and
+  shared by all targets.
+- If `onnxruntime` is installed (`requirements-onnx.txt`) and
+  `python-models/models/v2-onnx` holds an export for every target (see
+  `models/export_onnx.py`), the regressors run through ONNX Runtime instead of
+  sklearn; preprocessing stays in sklearn.
+- Skips per-field Pydantic validation on `/predict`: the raw JSON object is
+  parsed with orjson and wrapped with `Features.model_construct`, and non-numeric values are rejected
+  when the row is assembled, with the same 422 error list as `/predict_batch`.
+- Keeps an in-process LRU cache of predictions keyed by the exact feature
+  tuple, so repeated profiles skip inference.
 - Coerces predictions to non-negative integers for stable downstream use.
 """
 
 from __future__ import annotations
 
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import joblib
 import numpy as np
+import orjson
 import pandas as pd
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, ValidationError
+from threadpoolctl import threadpool_limits
 
+try:  # Optional accelerated backend for the regressors
+    import onnxruntime as ort
+except ImportError:  # pragma: no cover - falls back to sklearn predict
+    ort = None
 
-app = FastAPI(title="MEPS v2 Utilization Service", version="1.0.0")
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="MEPS v2 Utilization Service",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 # ---------------------------------------------------------------------------
 # Compatibility shim for pickled pipelines
 #
@@ -48,11 +93,9 @@ def neg_to_nan(X):
     Works with pandas Series/DataFrame or array-like inputs.
     """
     if isinstance(X, (pd.Series, pd.DataFrame)):
-        return X.mask(X < 0)
-    arr = np.asarray(X, dtype=float)
-    arr = arr.copy()
-    arr[arr < 0] = np.nan
-    return arr
+        return X.where(X >= 0)
+    arr = np.asarray(X, dtype=np.float64)
+    return np.where(arr < 0, np.nan, arr)
 
 
 # Expose under the module path expected by the pickle, if applicable
@@ -61,6 +104,9 @@ if mp_main is None:
     mp_main = types.ModuleType("__mp_main__")
     sys.modules["__mp_main__"] = mp_main
 setattr(mp_main, "neg_to_nan", neg_to_nan)
+# Pickle (and so joblib.hash) the helper by this path too, so preprocessor hashes
+# don't depend on the name this module was imported under
+neg_to_nan.__module__ = "__mp_main__"
 
 
 
@@ -119,6 +165,24 @@ FEATURE_COLS = [
 ]
 
 
+def _compile_feature_key() -> Any:
+    """
+    Generate a straight-line function mapping a `Features` instance to its
+    cache key: one `None`-or-float entry per column in FEATURE_COLS
+    order, with no per-request loop over the column list.
+    """
+    lines = ["def _feature_key(f):", "    return ("]
+    for col in FEATURE_COLS:
+        lines.append(f"        None if f.{col} is None else float(f.{col}),")
+    lines.append("    )")
+    namespace: Dict[str, Any] = {}
+    exec("\n".join(lines), namespace)  # noqa: S102 - source built from FEATURE_COLS only
+    return namespace["_feature_key"]
+
+
+_feature_key = _compile_feature_key()
+
+
 class Features(BaseModel):
     # Define features as optional floats to allow NaNs; integers are acceptable as floats
     age_years_2022: Optional[float] = None
@@ -160,15 +224,28 @@ class Features(BaseModel):
     sadness_frequency_30d: Optional[float] = None
 
 
-# Lazy-loaded model registry
-_MODELS: Dict[str, Any] | None = None
+# Upper bound on /predict_batch rows, so one request cannot tie up a worker or
+# allocate an unbounded feature matrix; larger requests get a 422
+MAX_BATCH_ROWS = 1000
 
 
-def _load_models() -> Dict[str, Any]:
-    global _MODELS
-    if _MODELS is not None:
-        return _MODELS
+class BatchRequest(BaseModel):
+    rows: List[Features] = Field(max_length=MAX_BATCH_ROWS)
+
+
+# Model registry, populated once per process-pool worker:
+# preprocessor hash -> fitted preprocessing stages, target -> (hash, regressor)
+_PREPROCESSORS: Dict[str, Any] = {}
+_MODELS: Dict[str, Tuple[str, Any]] = {}
 
+# Inference worker processes
+PREDICT_WORKERS = int(
+    os.environ.get("PY_PREDICT_WORKERS", max(1, min(4, os.cpu_count() or 1)))
+)
+_EXECUTOR: ProcessPoolExecutor | None = None
+
+
+def _load_models() -> Dict[str, Any]:
     repo_root = Path(__file__).resolve().parents[2]
     models_dir = repo_root / "python-models" / "models" / "v2-pkl"
     if not models_dir.exists():
@@ -179,45 +256,390 @@ def _load_models() -> Dict[str, Any]:
         model_path = models_dir / f"model_{target}.pkl"
         if not model_path.exists():
             raise RuntimeError(f"Missing model file: {model_path}")
-        registry[target] = joblib.load(str(model_path))
+        # Memory-map the estimator arrays read-only so every worker process
+        # shares the same page-cache copy (requires uncompressed pickles).
+        # The arrays are kept as saved: HistGradientBoostingRegressor tree nodes
+        # use a fixed float64 record dtype (PREDICTOR_RECORD_DTYPE) that the
+        # Cython predict kernel requires, so they cannot be downcast to float32.
+        registry[target] = joblib.load(str(model_path), mmap_mode="r")
 
-    _MODELS = registry
     return registry
 
 
-@app.get("/health")
-def health() -> Dict[str, str]:
+class _OnnxRegressor:
+    """Adapter exposing an ONNX Runtime session through the sklearn `predict` API."""
+
+    def __init__(self, session: Any):
+        self._session = session
+        self._input = session.get_inputs()[0].name
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        out = self._session.run(None, {self._input: np.asarray(X, dtype=np.float32)})[0]
+        return out.ravel()
+
+
+def _load_onnx_regressors(
+    estimators: Dict[str, Tuple[str, Any]],
+) -> Dict[str, _OnnxRegressor]:
+    """
+    Load ONNX exports of the regressors, or {} if unavailable, incomplete or
+    exported from different pipelines than the ones in `estimators`.
+    """
+    if ort is None:
+        return {}
+
+    repo_root = Path(__file__).resolve().parents[2]
+    onnx_dir = repo_root / "python-models" / "models" / "v2-onnx"
+    paths = {target: onnx_dir / f"model_{target}.onnx" for target in COUNT_TARGETS}
+    if not all(path.exists() for path in paths.values()):
+        return {}
+
+    options = ort.SessionOptions()
+    # Parallelism comes from the process pool; keep each session single-threaded
+    options.intra_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    regressors: Dict[str, _OnnxRegressor] = {}
+    for target, path in paths.items():
+        session = ort.InferenceSession(
+            str(path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        # export_onnx.py records the hashes of the pipeline it converted; a
+        # stale export would silently serve predictions from an old model
+        metadata = session.get_modelmeta().custom_metadata_map
+        key, est = estimators[target]
+        expected = {"preprocessor_hash": key, "estimator_hash": joblib.hash(est)}
+        for name, value in expected.items():
+            if metadata.get(name) != value:
+                logger.warning(
+                    "ONNX export %s has %s %r, expected %r; using sklearn regressors",
+                    path.name,
+                    name,
+                    metadata.get(name),
+                    value,
+                )
+                return {}
+        regressors[target] = _OnnxRegressor(session)
+    return regressors
+
+
+def _split_pipelines(
+    pipelines: Dict[str, Any],
+) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, Any]]]:
+    """
+    Split each pipeline into (preprocessing, regressor), keeping one copy of
+    each distinct preprocessor so identical transforms run once per batch.
+    """
+    preprocessors: Dict[str, Any] = {}
+    estimators: Dict[str, Tuple[str, Any]] = {}
+    for target, pipe in pipelines.items():
+        pre = pipe[:-1]
+        key = joblib.hash(pre)
+        preprocessors.setdefault(key, pre)
+        estimators[target] = (key, pipe[-1])
+    return preprocessors, estimators
+
+
+def _preload_models() -> None:
+    """Process-pool initializer: load every pipeline and run one dummy predict."""
+    preprocessors, estimators = _split_pipelines(_load_models())
+    # Parallelism comes from the process pool, as for the ONNX sessions: cap the
+    # OpenMP/BLAS pools (loaded with sklearn above) so PREDICT_WORKERS processes
+    # don't each start a thread per core
+    threadpool_limits(1)
+    onnx_regressors = _load_onnx_regressors(estimators)
+    if onnx_regressors:
+        estimators = {
+            target: (key, onnx_regressors[target])
+            for target, (key, _) in estimators.items()
+        }
+    _PREPROCESSORS.update(preprocessors)
+    _MODELS.update(estimators)
+    _predict_array(np.zeros((1, len(FEATURE_COLS))))
+
+
+def _worker_ready() -> int:
+    # Hold the worker briefly so concurrent probes spread across the pool
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _start_pool() -> ProcessPoolExecutor:
+    # Spawned workers do not inherit the server's event loop, signal handlers
+    # or wakeup fd, so a dying worker cannot take the server down with it
+    return ProcessPoolExecutor(
+        max_workers=PREDICT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_preload_models,
+    )
+
+
+def _replace_pool(executor: ProcessPoolExecutor) -> None:
+    """Swap a broken pool for a fresh one; concurrent failures share one rebuild."""
+    global _EXECUTOR
+    if _EXECUTOR is executor:
+        _EXECUTOR = _start_pool()
+        executor.shutdown(wait=False, cancel_futures=True)
+        # Start the new workers loading now rather than on the next request
+        for _ in range(PREDICT_WORKERS):
+            _EXECUTOR.submit(_worker_ready)
+
+
+def _pool_broken(executor: ProcessPoolExecutor) -> bool:
+    # ProcessPoolExecutor exposes no public state; `_broken` is set once a worker
+    # dies, and the alive check catches a death the manager has not noticed yet
+    processes = getattr(executor, "_processes", None) or {}
+    return bool(getattr(executor, "_broken", False)) or any(
+        not process.is_alive() for process in processes.values()
+    )
+
+
+async def _run_in_pool(fn: Any, *args: Any) -> Any:
+    """Run `fn` on the inference pool, replacing the pool if a worker has died."""
+    executor = _EXECUTOR
+    if executor is None:
+        raise RuntimeError("Prediction workers not running")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    except BrokenProcessPool:
+        _replace_pool(executor)
+        raise
+
+
+@app.on_event("startup")
+async def _warmup() -> None:
+    """Start the worker pool and wait until every worker has its models loaded."""
+    global _EXECUTOR
+    _EXECUTOR = _start_pool()
+    # Spawned workers start lazily and a job only runs after its worker's
+    # initializer, so keep probing until every worker has answered at least once
+    ready: Set[int] = set()
+    while len(ready) < PREDICT_WORKERS:
+        ready.update(
+            await asyncio.gather(
+                *(_run_in_pool(_worker_ready) for _ in range(PREDICT_WORKERS))
+            )
+        )
+
+
+# Micro-batching of concurrent /predict requests
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 2.0
+
+_QUEUE: asyncio.Queue | None = None
+_BATCHER: asyncio.Task | None = None
+_INFLIGHT: Set[asyncio.Task] = set()
+
+# LRU cache of predictions keyed by the feature tuple
+PREDICTION_CACHE_SIZE = 4096
+_PREDICTION_CACHE: "OrderedDict[Tuple[Optional[float], ...], Dict[str, int]]" = OrderedDict()
+
+
+def _predict_array(X: np.ndarray) -> Dict[str, np.ndarray]:
+    """Run every target pipeline once over a stacked (n_rows, n_features) batch."""
+    # The pipelines select columns by name, so they still need a DataFrame; wrapping
+    # a float64 array without copying skips pandas' per-column dtype inference.
+    frame = pd.DataFrame(X, columns=FEATURE_COLS, copy=False)
+    transformed = {key: pre.transform(frame) for key, pre in _PREPROCESSORS.items()}
+    # Targets run serially on one thread; the process pool provides parallelism
+    return {
+        target: est.predict(transformed[key]) for target, (key, est) in _MODELS.items()
+    }
+
+
+def _to_counts(preds: Dict[str, np.ndarray]) -> List[Dict[str, int]]:
+    """Coerce per-target predictions to non-negative ints, one dict per row."""
+    targets = list(preds)
+    counts = np.clip(np.rint(np.vstack(list(preds.values()))), 0, None).astype(np.int64)
+    return [dict(zip(targets, column)) for column in counts.T.tolist()]
+
+
+async def _run_batch(batch: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+    X = np.vstack([row for row, _ in batch])
     try:
-        _ = _load_models()
-        return {"status": "ok"}
+        preds = await _run_in_pool(_predict_array, X)
     except Exception as e:  # noqa: BLE001
-        raise HTTPException(status_code=500, detail=str(e))
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(e)
+        return
+
+    for (_, fut), outputs in zip(batch, _to_counts(preds)):
+        # The caller may have disconnected (cancelled) while the batch ran
+        if not fut.done():
+            fut.set_result(outputs)
+
+
+async def _batch_loop(queue: asyncio.Queue) -> None:
+    """Collect up to MAX_BATCH_SIZE requests within MAX_WAIT_MS, then dispatch."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000.0
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        task = asyncio.create_task(_run_batch(batch))
+        _INFLIGHT.add(task)
+        task.add_done_callback(_INFLIGHT.discard)
+
+
+@app.on_event("startup")
+async def _start_batcher() -> None:
+    global _QUEUE, _BATCHER
+    _QUEUE = asyncio.Queue()
+    _BATCHER = asyncio.create_task(_batch_loop(_QUEUE))
+
+
+@app.on_event("shutdown")
+async def _stop_batcher() -> None:
+    if _BATCHER is not None:
+        _BATCHER.cancel()
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+
+@app.get("/health")
+async def health() -> Dict[str, str]:
+    executor = _EXECUTOR
+    if executor is None:
+        raise HTTPException(status_code=503, detail="Prediction workers not running")
+    if _pool_broken(executor):
+        _replace_pool(executor)
+        raise HTTPException(status_code=503, detail="Prediction workers restarting")
+    return {"status": "ok"}
+
 
+def _validation_error(payload: Any) -> RequestValidationError:
+    """
+    Build the 422 for a /predict body rejected on the fast path, with the same
+    error list FastAPI returns for /predict_batch.
+    """
+    try:
+        Features.model_validate(payload)
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors()]
+    else:
+        errors = [
+            {
+                "type": "value_error",
+                "loc": ("body",),
+                "msg": "Value error, feature values must be finite numbers",
+                "input": payload,
+            }
+        ]
+    return RequestValidationError(errors)
+
+
+@app.post(
+    "/predict",
+    # The body is parsed by hand to skip validation; document it as Features
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"$ref": "#/components/schemas/Features"}}
+            },
+        }
+    },
+)
+async def predict(request: Request) -> Dict[str, int]:
+    if _QUEUE is None:
+        raise HTTPException(status_code=503, detail="Prediction batcher not running")
 
-@app.post("/predict")
-def predict(features: Features) -> Dict[str, int]:
     try:
-        models = _load_models()
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "json_invalid",
+                    "loc": ("body", e.pos),
+                    "msg": "JSON decode error",
+                    "input": {},
+                    "ctx": {"error": e.msg},
+                }
+            ]
+        )
+    if not isinstance(payload, dict):
+        raise _validation_error(payload)
+
+    # Fields are all optional floats, so skip validation and let the float()
+    # coercion below reject anything non-numeric. Unknown keys are dropped
+    # first so they cannot reach model_construct's own keyword arguments.
+    features = Features.model_construct(
+        **{k: payload[k] for k in Features.model_fields.keys() & payload.keys()}
+    )
+
+    # Ensure ordered columns; the key doubles as the model input row
+    try:
+        key = _feature_key(features)
+    except (TypeError, ValueError, OverflowError):
+        raise _validation_error(payload)
+
+    cached = _PREDICTION_CACHE.get(key)
+    if cached is not None:
+        _PREDICTION_CACHE.move_to_end(key)
+        return cached
+
+    # NumPy maps missing (None) features to NaN
+    row = np.array(key, dtype=np.float64)
+    fut = asyncio.get_running_loop().create_future()
+    _QUEUE.put_nowait((row, fut))
+    try:
+        outputs = await fut
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Prediction workers restarting")
+    except Exception as e:  # noqa: BLE001
+        raise HTTPException(status_code=500, detail=str(e))
+
+    _PREDICTION_CACHE[key] = outputs
+    if len(_PREDICTION_CACHE) > PREDICTION_CACHE_SIZE:
+        _PREDICTION_CACHE.popitem(last=False)
+    return outputs
 
-        # Ensure ordered columns; allow missing keys to be None
-        row = {col: getattr(features, col) for col in FEATURE_COLS}
-        X = pd.DataFrame([row], columns=FEATURE_COLS)
 
-        outputs: Dict[str, int] = {}
-        for target, pipe in models.items():
-            # Each saved pipeline includes preprocessing and model
-            pred_value = float(pipe.predict(X)[0])
-            outputs[target] = max(0, int(round(pred_value)))
+@app.post("/predict_batch")
+async def predict_batch(req: BatchRequest) -> List[Dict[str, int]]:
+    if _EXECUTOR is None:
+        raise HTTPException(status_code=503, detail="Prediction workers not running")
+    if not req.rows:
+        return []
 
-        return outputs
+    # Same row assembly as /predict so both endpoints agree for the same profile
+    X = np.array([_feature_key(features) for features in req.rows], dtype=np.float64)
+    try:
+        preds = await _run_in_pool(_predict_array, X)
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Prediction workers restarting")
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=str(e))
 
+    return _to_counts(preds)
+
 
 if __name__ == "__main__":
-    # Local dev runner: python python-models/server/main.py
+    # Production runner: python python-models/server/server.py
+    # (for local development with reload, use python-models/dev.sh)
     import uvicorn
 
-    uvicorn.run(app, host="127.0.0.1", port=8001, reload=True)
+    workers = int(os.environ.get("PY_WORKERS", os.cpu_count() or 1))
+    # Every Uvicorn worker starts its own inference pool; default to one
+    # process each so the total stays near one process per core
+    os.environ.setdefault("PY_PREDICT_WORKERS", "1")
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get("PY_HOST", "0.0.0.0"),
+        port=int(os.environ.get("PY_PORT", "8001")),
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        reload=False,
+    )
 
 